@@ -0,0 +1,34 @@
+# Copyright [2024] Stefan Dendorfer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+This python script converts the NAS-Bench 101 tfrecord into plain numpy arrays
+of the final metrics of every architecture. If the arrays exist,
+create_run_data.py memory-maps them instead of parsing the tfrecord, so that
+all of its worker processes share a single copy of the benchmark.
+
+Requirements:
+
+-The same as for create_run_data.py. The script only needs to be run once.
+
+'''
+
+from create_run_data import NB_ARRAYS_DIR, NB_DATASET_PATH, save_arrays
+from nasbench.api import NASBench
+
+
+if __name__ == "__main__":
+    nasb = NASBench(NB_DATASET_PATH)
+    save_arrays(nasb, NB_ARRAYS_DIR)
+    print(f"Arrays saved to {NB_ARRAYS_DIR}.")
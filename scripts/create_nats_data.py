@@ -32,39 +32,81 @@ https://github.com/D-X-Y/AutoDL-Projects?tab=readme-ov-file#requirements-and-pre
 please make sure to add this into the torch home directory. 
 '''
 
+import argparse
 import subprocess
+import threading
 
 
-if __name__ == "__main__":
-    BUDGET = 200000
-    LOOPS = 1
+def start_command(command):
+    """Starts the command with its stdout and stderr merged into a pipe."""
+    return subprocess.Popen(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True, bufsize=1)
+
+
+def stream_output(proc, prefix=""):
+    """Prints the output of the process line by line until it exits."""
+    with proc:
+        for line in proc.stdout:
+            print(prefix + line, end="")
 
-    command = [
+
+def main(budget, loops, parallel=False):
+    """Runs regularized evolution and REINFORCE on the NATS-Bench tss space."""
+    ea_command = [
         "python", 
         "./thirdparty/autodl/exps/NATS-algos/regularized_ea.py",
         "--save_dir", "./data/generated", 
         "--dataset", "cifar10",
         "--search_space", "tss",
-        "--time_budget", str(BUDGET),
-        "--loops_if_rand", str(LOOPS),
+        "--time_budget", str(budget),
+        "--loops_if_rand", str(loops),
         "--ea_cycles", "200",
         "--ea_population", "20",
         "--ea_sample_size", "10"
     ]
-    print("Running regularized evolution...")
-    subprocess.run(command, capture_output=True, text=True)
-    print("done")
-
-    command = [
+    reinforce_command = [
         "python", 
         "./thirdparty/autodl/exps/NATS-algos/reinforce.py",
         "--save_dir", "./data/generated", 
         "--dataset", "cifar10",
         "--search_space", "tss",
-        "--time_budget", str(BUDGET),
-        "--loops_if_rand", str(LOOPS),
+        "--time_budget", str(budget),
+        "--loops_if_rand", str(loops),
         "--learning_rate", str(0.01),
     ]
-    print("Running reinforce...")
-    subprocess.run(command, capture_output=True, text=True)
-    print("done")
+
+    if parallel:
+        print("Running regularized evolution and reinforce...")
+        # Prefix the interleaved output lines with the experiment name.
+        threads = [
+            threading.Thread(target=stream_output,
+                             args=(start_command(command), prefix))
+            for command, prefix in [(ea_command, "[ea] "),
+                                    (reinforce_command, "[reinforce] ")]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print("done")
+    else:
+        print("Running regularized evolution...")
+        stream_output(start_command(ea_command))
+        print("done")
+
+        print("Running reinforce...")
+        stream_output(start_command(reinforce_command))
+        print("done")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=200000,
+                        help="time budget of each search in seconds")
+    parser.add_argument("--loops", type=int, default=1,
+                        help="number of runs of each search")
+    parser.add_argument("--parallel", action="store_true",
+                        help="run both experiments concurrently")
+    args = parser.parse_args()
+
+    main(args.budget, args.loops, args.parallel)
@@ -30,18 +30,33 @@ be found here:
 https://github.com/google-research/nasbench?tab=readme-ov-file#download-the-dataset
 please make sure to adjust the NB_DATASET_PATH accordingly. 
 
+-Optionally, the tfrecord can be converted once via create_nasbench_arrays.py.
+The resulting arrays in NB_ARRAYS_DIR are memory-mapped and shared by all 
+worker processes instead of each parsing the tfrecord.
+
 '''
 
 
 import random
-import copy
+import collections
 import os 
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 import numpy as np
-import tensorflow as tf
 import json
-from nasbench.api import NASBench, ModelSpec
+
+# The benchmark is only read from tabular data, so keep tensorflow (imported
+# by nasbench) from initializing a GPU context in every worker.
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+from nasbench.api import NASBench, ModelSpec, OutOfDomainError
 
 NB_DATASET_PATH = os.path.join("data", "nasbench_only108.tfrecord")
+# Arrays written by create_nasbench_arrays.py, used instead of the tfrecord
+# if present.
+NB_ARRAYS_DIR = os.path.join("data", "nasbench_arrays")
 
 # Useful constants for nasbench
 INPUT = "input"
@@ -50,131 +65,364 @@ CONV3X3 = "conv3x3-bn-relu"
 CONV1X1 = "conv1x1-bn-relu"
 MAXPOOL3X3 = "maxpool3x3"
 NUM_VERTICES = 7
+EPOCHS = 108  # The only epoch budget stored in the arrays
 MAX_EDGES = 9
 EDGE_SPOTS = NUM_VERTICES * (NUM_VERTICES - 1) / 2  # Upper triangular matrix
 OP_SPOTS = NUM_VERTICES - 2  # Input/output vertices are fixed
 ALLOWED_OPS = [CONV3X3, CONV1X1, MAXPOOL3X3]
 ALLOWED_EDGES = [0, 1]  # Binary adjacency matrix
-
-physical_devices = tf.config.experimental.list_physical_devices("GPU")
-
-if len(physical_devices) > 0:
-    print("Using GPU for tf.")
-    tf.config.experimental.set_memory_growth(physical_devices[0], True)
-else:
-    print("No GPU.")
-
-
-
-def random_spec(nasbench: NASBench):
+# Row i holds the ALLOWED_OPS indices an op with index i can be mutated into
+OP_COMPLEMENT = np.array([[j for j in range(len(ALLOWED_OPS)) if j != i]
+                          for i in range(len(ALLOWED_OPS))], dtype=np.int8)
+RANDOM_SPEC_BATCH = 64  # Candidates sampled per batch in random_spec
+
+
+class HashedModelSpec(ModelSpec):
+    """ModelSpec that computes its hash only once per set of canonical ops.
+
+    The hash is shared between NASBench.query and the query cache. Specs
+    built with from_op_indices also keep the int8 ALLOWED_OPS indices of
+    their inner vertices, which the search mutates instead of the op names.
+    """
+
+    def __init__(self, matrix, ops, data_format="channels_last"):
+        super().__init__(matrix, ops, data_format)
+        self._hashes = {}
+        self.op_indices = None
+
+    @classmethod
+    def from_op_indices(cls, matrix, op_indices):
+        """Builds a spec, translating the op indices to names only here."""
+        ops = [INPUT] + [ALLOWED_OPS[i] for i in op_indices] + [OUTPUT]
+        spec = cls(matrix, ops)
+        spec.op_indices = op_indices
+        return spec
+
+    def hash_spec(self, canonical_ops):
+        key = tuple(canonical_ops)
+        if key not in self._hashes:
+            self._hashes[key] = super().hash_spec(canonical_ops)
+        return self._hashes[key]
+
+
+def save_arrays(nasbench: NASBench, arrays_dir):
+    """Saves the final metrics of all architectures as one array per field.
+
+    The metrics of the EPOCHS budget are stored with one column per repeat,
+    the rows follow the order of hashes.npy.
+    """
+    hashes = list(nasbench.hash_iterator())
+    num_repeats = nasbench.config["num_repeats"]
+    fields = {
+        "training_time": "final_training_time",
+        "validation_accuracy": "final_validation_accuracy",
+        "test_accuracy": "final_test_accuracy",
+    }
+    arrays = {name: np.empty((len(hashes), num_repeats))
+              for name in fields}
+    for idx, module_hash in enumerate(hashes):
+        _, computed_stats = nasbench.get_metrics_from_hash(module_hash)
+        for repeat, stats in enumerate(computed_stats[EPOCHS]):
+            for name, key in fields.items():
+                arrays[name][idx, repeat] = stats[key]
+
+    os.makedirs(arrays_dir, exist_ok=True)
+    np.save(os.path.join(arrays_dir, "hashes.npy"), np.array(hashes))
+    for name, array in arrays.items():
+        np.save(os.path.join(arrays_dir, name + ".npy"), array)
+
+
+class ArrayNASBench:
+    """Read-only NASBench backed by the arrays written by save_arrays.
+
+    The arrays are memory-mapped, so all processes using the same files
+    share their pages through the page cache instead of each parsing the
+    tfrecord. Queries sample a repeat like NASBench.query, but only the
+    final metrics at EPOCHS are available.
+    """
+
+    def __init__(self, arrays_dir):
+        def load(name):
+            return np.load(os.path.join(arrays_dir, name + ".npy"),
+                           mmap_mode="r")
+
+        self.training_time = load("training_time")
+        self.validation_accuracy = load("validation_accuracy")
+        self.test_accuracy = load("test_accuracy")
+        self.num_repeats = self.training_time.shape[1]
+        self.index = {module_hash: idx for idx, module_hash
+                      in enumerate(load("hashes").tolist())}
+        self.reset_budget_counters()
+
+    def is_valid(self, model_spec):
+        """Checks the validity of the model_spec like NASBench.is_valid."""
+        try:
+            self._check_spec(model_spec)
+        except OutOfDomainError:
+            return False
+
+        return True
+
+    def query(self, model_spec):
+        """Returns the final metrics of one sampled repeat of model_spec."""
+        self._check_spec(model_spec)
+        idx = self.index[model_spec.hash_spec(ALLOWED_OPS)]
+        repeat = random.randint(0, self.num_repeats - 1)
+        data = {
+            "training_time": float(self.training_time[idx, repeat]),
+            "validation_accuracy":
+                float(self.validation_accuracy[idx, repeat]),
+            "test_accuracy": float(self.test_accuracy[idx, repeat]),
+        }
+        self.training_time_spent += data["training_time"]
+        self.total_epochs_spent += EPOCHS
+        return data
+
+    def get_budget_counters(self):
+        """Returns the time and number of epochs spent on queries."""
+        return self.training_time_spent, self.total_epochs_spent
+
+    def reset_budget_counters(self):
+        """Resets the time and epoch budget counters."""
+        self.training_time_spent = 0.0
+        self.total_epochs_spent = 0
+
+    def _check_spec(self, model_spec):
+        """Raises OutOfDomainError if model_spec is not in the benchmark."""
+        if not model_spec.valid_spec:
+            raise OutOfDomainError("invalid spec, provided graph is "
+                                   "disconnected.")
+
+        num_vertices = len(model_spec.ops)
+        num_edges = np.sum(model_spec.matrix)
+        if num_vertices > NUM_VERTICES:
+            raise OutOfDomainError("too many vertices, got %d (max vertices "
+                                   "= %d)" % (num_vertices, NUM_VERTICES))
+        if num_edges > MAX_EDGES:
+            raise OutOfDomainError("too many edges, got %d (max edges = %d)"
+                                   % (num_edges, MAX_EDGES))
+        if model_spec.ops[0] != INPUT:
+            raise OutOfDomainError("first operation should be 'input'")
+        if model_spec.ops[-1] != OUTPUT:
+            raise OutOfDomainError("last operation should be 'output'")
+        for op in model_spec.ops[1:-1]:
+            if op not in ALLOWED_OPS:
+                raise OutOfDomainError("unsupported op %s (available ops = %s)"
+                                       % (op, ALLOWED_OPS))
+
+
+def load_benchmark():
+    """Loads the memory-mapped arrays if they exist, else the tfrecord."""
+    if os.path.isdir(NB_ARRAYS_DIR):
+        return ArrayNASBench(NB_ARRAYS_DIR)
+    return NASBench(NB_DATASET_PATH)
+
+
+def random_spec(nasbench: NASBench, rng: np.random.Generator):
     """Returns a random valid spec."""
     while True:
-        matrix = np.random.choice(ALLOWED_EDGES,
-                                  size=(NUM_VERTICES, NUM_VERTICES))
-        matrix = np.triu(matrix, 1)
-        ops = np.random.choice(ALLOWED_OPS, size=NUM_VERTICES).tolist()
-        ops[0] = INPUT
-        ops[-1] = OUTPUT
-        spec = ModelSpec(matrix=matrix, ops=ops)
-        if nasbench.is_valid(spec):
-            return spec
-
-
-def mutate_spec(old_spec, nasbench: NASBench, mutation_rate=1.0):
+        # Sample a batch of candidates at once and return the first valid one.
+        matrices = rng.integers(
+            0, len(ALLOWED_EDGES),
+            size=(RANDOM_SPEC_BATCH, NUM_VERTICES, NUM_VERTICES),
+            dtype=np.int8)
+        matrices = np.triu(matrices, 1)
+        op_indices = rng.integers(
+            0, len(ALLOWED_OPS), size=(RANDOM_SPEC_BATCH, OP_SPOTS),
+            dtype=np.int8)
+        for matrix, op_idx in zip(matrices, op_indices):
+            spec = HashedModelSpec.from_op_indices(matrix, op_idx)
+            if nasbench.is_valid(spec):
+                return spec
+
+
+def mutate_arrays(matrix, op_indices, edge_mutation_prob, op_mutation_prob,
+                  rng: np.random.Generator):
+    """Returns mutated copies of an adjacency matrix and its op indices.
+
+    op_indices holds the ALLOWED_OPS indices of the OP_SPOTS inner vertices.
+    Both arrays are kept as int8, matching the specs from random_spec.
+    """
+    flip = rng.random((NUM_VERTICES, NUM_VERTICES)) < edge_mutation_prob
+    new_matrix = matrix.astype(np.int8) ^ np.triu(flip, 1).astype(np.int8)
+
+    mutate = rng.random(OP_SPOTS) < op_mutation_prob
+    choices = rng.integers(0, len(ALLOWED_OPS) - 1, size=OP_SPOTS,
+                           dtype=np.int8)
+    new_op_indices = np.where(mutate, OP_COMPLEMENT[op_indices, choices],
+                              op_indices)
+    return new_matrix, new_op_indices
+
+
+def mutate_spec(old_spec, nasbench: NASBench, rng: np.random.Generator,
+                mutation_rate=1.0):
     """Computes a valid mutated spec from the old_spec."""
+    old_op_indices = getattr(old_spec, "op_indices", None)
+    if old_op_indices is None:
+        old_op_indices = np.array(
+            [ALLOWED_OPS.index(op) for op in old_spec.original_ops[1:-1]],
+            dtype=np.int8)
+
+    # In expectation, V edges flipped (note that most end up being pruned).
+    edge_mutation_prob = mutation_rate / NUM_VERTICES
+    # In expectation, one op is resampled.
+    op_mutation_prob = mutation_rate / OP_SPOTS
     while True:
-        new_matrix = copy.deepcopy(old_spec.original_matrix)
-        new_ops = copy.deepcopy(old_spec.original_ops)
-
-        # In expectation, V edges flipped (note that most end up being pruned).
-        edge_mutation_prob = mutation_rate / NUM_VERTICES
-        for src in range(0, NUM_VERTICES - 1):
-            for dst in range(src + 1, NUM_VERTICES):
-                if random.random() < edge_mutation_prob:
-                    new_matrix[src, dst] = 1 - new_matrix[src, dst]
-
-        # In expectation, one op is resampled.
-        op_mutation_prob = mutation_rate / OP_SPOTS
-        for ind in range(1, NUM_VERTICES - 1):
-            if random.random() < op_mutation_prob:
-                available = [
-                    o for o in nasbench.config["available_ops"]
-                    if o != new_ops[ind]
-                ]
-                new_ops[ind] = random.choice(available)
-
-        new_spec = ModelSpec(new_matrix, new_ops)
+        new_matrix, new_op_indices = mutate_arrays(
+            old_spec.original_matrix, old_op_indices, edge_mutation_prob,
+            op_mutation_prob, rng)
+        new_spec = HashedModelSpec.from_op_indices(new_matrix, new_op_indices)
         if nasbench.is_valid(new_spec):
             return new_spec
         
 
-def random_combination(iterable, sample_size):
+def random_combination(iterable, sample_size, rng: np.random.Generator):
     """Random selection from itertools.combinations(iterable, r)."""
     pool = tuple(iterable)
     n = len(pool)
-    indices = sorted(random.sample(range(n), sample_size))
+    indices = np.sort(rng.choice(n, size=sample_size, replace=False))
     return tuple(pool[i] for i in indices)
 
+
+def query_spec(nasbench: NASBench, spec, cache=None):
+    """Queries the spec, reusing a cached result if the spec was seen before.
+
+    A cached result still adds its training time to the budget counter, but
+    it keeps the repeat that was sampled on the first query of the spec.
+    """
+    if cache is None:
+        return nasbench.query(spec)
+
+    key = spec.hash_spec(ALLOWED_OPS)
+    if key in cache:
+        data = cache[key]
+        nasbench.training_time_spent += data["training_time"]
+        return data
+
+    data = nasbench.query(spec)
+    cache[key] = data
+    return data
+
+
 def run_revolution_search(
     nasbench: NASBench,
     max_time_budget=5e6,
     population_size=50,
     tournament_size=10,
-    mutation_rate=0.5
+    mutation_rate=0.5,
+    cache_queries=False,
+    track_history=False,
+    rng: np.random.Generator = None,
+    seed=None
 ):
-    """Run a single roll-out of regularized evolution to a fixed time budget."""
-
-    times, best_valids, best_tests = [0.0], [0.0], [0.0]
-    population = []  # (validation, spec) tuples
+    """Run a single roll-out of regularized evolution to a fixed time budget.
+
+    If cache_queries is set, rediscovered architectures reuse their first
+    query result instead of sampling a new repeat from the benchmark.
+
+    With track_history the times and running best accuracies after every
+    query are returned as lists, otherwise only their final values.
+
+    All sampling and mutation draws come from rng. If none is given, a
+    generator is created from seed. A given seed also seeds the random
+    module, which NASBench uses to sample the queried repeat, so that a
+    roll-out does not depend on the global state left by earlier ones.
+    """
+    if seed is not None:
+        random.seed(seed)
+    if rng is None:
+        rng = np.random.default_rng(seed)
+
+    time_spent, best_valid, best_test = 0.0, 0.0, 0.0
+    if track_history:
+        times, best_valids, best_tests = [0.0], [0.0], [0.0]
+    # (validation, spec) tuples, appending beyond maxlen drops the oldest.
+    population = collections.deque(maxlen=population_size)
+    cache = {} if cache_queries else None
 
     # For the first population_size individuals, seed the population with
     # randomly generated cells.
     for _ in range(population_size):
-        spec = random_spec(nasbench)
-        data = nasbench.query(spec)
+        spec = random_spec(nasbench, rng)
+        data = query_spec(nasbench, spec, cache)
         time_spent, _ = nasbench.get_budget_counters()
-        times.append(time_spent)
         population.append((data["validation_accuracy"], spec))
 
-        if data["validation_accuracy"] > best_valids[-1]:
-            best_valids.append(data["validation_accuracy"])
-            best_tests.append(data["test_accuracy"])
-        else:
-            best_valids.append(best_valids[-1])
-            best_tests.append(best_tests[-1])
+        if data["validation_accuracy"] > best_valid:
+            best_valid = data["validation_accuracy"]
+            best_test = data["test_accuracy"]
+
+        if track_history:
+            times.append(time_spent)
+            best_valids.append(best_valid)
+            best_tests.append(best_test)
 
         if time_spent > max_time_budget:
             break
     # After the population is seeded, proceed with evolving the population.
     while True:
-        sample = random_combination(population, tournament_size)
-        best_spec = sorted(sample, key=lambda i: i[0])[-1][1]
-        new_spec = mutate_spec(best_spec, nasbench, mutation_rate)
+        sample = random_combination(population, tournament_size, rng)
+        best_spec = max(sample, key=itemgetter(0))[1]
+        new_spec = mutate_spec(best_spec, nasbench, rng, mutation_rate)
 
-        data = nasbench.query(new_spec)
+        data = query_spec(nasbench, new_spec, cache)
         time_spent, _ = nasbench.get_budget_counters()
-        times.append(time_spent)
 
         # In regularized evolution, we kill the oldest individual.
         population.append((data["validation_accuracy"], new_spec))
-        population.pop(0)
 
-        if data["validation_accuracy"] > best_valids[-1]:
-            best_valids.append(data["validation_accuracy"])
-            best_tests.append(data["test_accuracy"])
-        else:
-            best_valids.append(best_valids[-1])
-            best_tests.append(best_tests[-1])
+        if data["validation_accuracy"] > best_valid:
+            best_valid = data["validation_accuracy"]
+            best_test = data["test_accuracy"]
+
+        if track_history:
+            times.append(time_spent)
+            best_valids.append(best_valid)
+            best_tests.append(best_test)
 
         if time_spent > max_time_budget:
             break
 
-    return times, best_valids, best_tests
+    if track_history:
+        return times, best_valids, best_tests
+    return time_spent, best_valid, best_test
+
+
+# Benchmark used by pool workers. With fork it is loaded once in the main
+# process and shared copy-on-write, otherwise _init_worker loads it.
+_worker_nasb = None
+
+
+def _init_worker():
+    """Loads the tabular benchmark once per worker process."""
+    global _worker_nasb
+    _worker_nasb = load_benchmark()
+
+
+def _run_repeat(max_time_budget, seed):
+    """Runs one seeded roll-out in a worker and returns its final accuracies."""
+    _worker_nasb.reset_budget_counters()
+    _, best_valid, best_test = run_revolution_search(
+        _worker_nasb, max_time_budget, 32, seed=seed
+    )
+    return best_valid, best_test
+
+
+def _create_executor():
+    """Creates a process pool that shares a single NASBench load if possible."""
+    if sys.platform != "win32":
+        global _worker_nasb
+        _worker_nasb = load_benchmark()
+        return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                   mp_context=mp.get_context("fork"))
+
+    return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                               mp_context=mp.get_context("spawn"),
+                               initializer=_init_worker)
 
 
 if __name__ == "__main__":
 
-    nasb = NASBench(NB_DATASET_PATH)
     valids_30 = []
     tests_30 = []
     valids_1000 = []
@@ -183,21 +431,26 @@ if __name__ == "__main__":
     budget = int(1e6)
     n_30 = 30
     n_1000 = 1000
-    for repeat in range(n_30):
-        nasb.reset_budget_counters()
-        _, best_valid, best_test = run_revolution_search(nasb, budget, 32)
-        valids_30.append(best_valid[-1])
-        tests_30.append(best_test[-1])
-        
-    print(f"{n_30} runs done")
-    for repeat in range(n_1000):
-        if (repeat % 100 == 0):
-            print('Running repeat %d' % (repeat))
-
-        nasb.reset_budget_counters()
-        _, best_valid, best_test = run_revolution_search(nasb, budget, 32)
-        valids_1000.append(best_valid[-1])
-        tests_1000.append(best_test[-1])
+    with _create_executor() as executor:
+        # Results are collected in submission order so that the saved run
+        # data only depends on the seeds.
+        futures = [executor.submit(_run_repeat, budget, seed)
+                   for seed in range(n_30)]
+        for future in futures:
+            best_valid, best_test = future.result()
+            valids_30.append(best_valid)
+            tests_30.append(best_test)
+
+        print(f"{n_30} runs done")
+        futures = [executor.submit(_run_repeat, budget, seed)
+                   for seed in range(n_30, n_30 + n_1000)]
+        for repeat, future in enumerate(futures):
+            if (repeat % 100 == 0):
+                print('Running repeat %d' % (repeat))
+
+            best_valid, best_test = future.result()
+            valids_1000.append(best_valid)
+            tests_1000.append(best_test)
 
     run_data = {}
     run_data['valids_30'] = valids_30
@@ -213,5 +466,3 @@ if __name__ == "__main__":
         json.dump(run_data, f)
 
     print("Run data saved successfully.")
-        
-